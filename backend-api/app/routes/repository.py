@@ -79,7 +79,8 @@ def add_repository():
         
         logger.info(f"GrimoireLab API response: {response.status_code} - {response.text}")
         
-        if response.status_code != 200:
+        # grimoirelab-api는 후속 작업을 백그라운드로 넘기고 202를 반환함
+        if response.status_code not in (200, 202):
             return jsonify({
                 "error": "Failed to update projects",
                 "details": response.json()
@@ -1,105 +1,152 @@
-import requests
-import json
+import orjson
 import time
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import Elasticsearch
 
 logger = logging.getLogger(__name__)
 
+# 인덱스 매핑을 동시에 업데이트할 최대 요청 수
+_MAPPING_UPDATE_WORKERS = 16
+
+# 한 번의 매핑 업데이트 요청에 묶을 인덱스 수 (URL 길이 제한 방지)
+_MAPPING_UPDATE_BATCH = 50
+
+ES_URL = "http://elasticsearch:9200"
+
+# 모든 설정 요청은 하나의 클라이언트 연결 풀로 보냄 (일시적인 게이트웨이 오류는 재시도)
+es_client = Elasticsearch(
+    [ES_URL],
+    maxsize=_MAPPING_UPDATE_WORKERS,
+    retry_on_timeout=True,
+    max_retries=3,
+    sniff_on_start=False
+)
+
+# 설정 요청 본문은 바뀌지 않으므로 import 시점에 한 번만 직렬화
+_KIBANA_INDEX_BODY = orjson.dumps({
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "index.mapping.total_fields.limit": 2000
+    },
+    "mappings": {
+        "properties": {
+            "type": {"type": "keyword"},
+            "dashboard": {"type": "keyword"},
+            "title": {"type": "text"},
+            "projectname": {"type": "keyword"},
+            "search": {"type": "keyword"},
+            "visualization": {"type": "keyword"}
+        }
+    }
+})
+
+_TEMPLATE_BODY = orjson.dumps({
+    "index_patterns": ["*"],
+    "settings": {
+        "number_of_shards": 1,
+        "number_of_replicas": 0,
+        "index.mapping.total_fields.limit": 2000,
+        "index.mapping.depth.limit": 20,
+        "index.mapping.nested_fields.limit": 50
+    },
+    "mappings": {
+        "dynamic": "true",
+        "properties": {
+            "projectname": {"type": "keyword"},
+            "metadata__timestamp": {"type": "date"},
+            "metadata__updated_on": {"type": "date"},
+            "grimoire_creation_date": {"type": "date"},
+            "author_name": {"type": "keyword"},
+            "author_org_name": {"type": "keyword"},
+            "author_uuid": {"type": "keyword"},
+            "title": {"type": "text"},
+            "repository": {"type": "keyword"}
+        }
+    }
+})
+
+_PROJECTNAME_MAPPING_BODY = orjson.dumps({"properties": {
+    "dynamic": "true",
+    "properties": {
+        "projectname": {"type": "keyword"}
+    }
+}})
+
+# 인덱스 패턴 필드의 공통 속성
+_INDEX_PATTERN_FIELD_DEFAULTS = {
+    "count": 0,
+    "scripted": False,
+    "searchable": True,
+    "aggregatable": True,
+    "readFromDocValues": True
+}
+
+# 인덱스별 (매핑 해시, 직렬화된 필드 목록) 캐시
+_index_pattern_fields_cache = {}
+
+# 이 프로세스에서 초기 설정이 이미 끝났는지 여부
+_setup_done = False
+
 def setup_elasticsearch():
     """Elasticsearch 초기 설정"""
-    ES_URL = "http://elasticsearch:9200"
+    global _setup_done
+    if _setup_done:
+        logger.info("Elasticsearch already set up, skipping")
+        return
     
-    # Elasticsearch가 준비될 때까지 대기
-    for _ in range(30):
-        try:
-            response = requests.get(ES_URL)
-            if response.status_code == 200:
-                break
-        except:
-            time.sleep(1)
+    # Elasticsearch가 준비될 때까지 대기 (본문 없는 HEAD 요청, 지수 백오프)
+    for attempt in range(30):
+        if es_client.ping(request_timeout=1):
+            break
+        time.sleep(min(0.1 * 2 ** attempt, 2))
     
     try:
         # 1. Kibana 인덱스 설정
-        kibana_settings = {
-            "settings": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0,
-                "index.mapping.total_fields.limit": 2000
-            },
-            "mappings": {
-                "properties": {
-                    "type": {"type": "keyword"},
-                    "dashboard": {"type": "keyword"},
-                    "title": {"type": "text"},
-                    "projectname": {"type": "keyword"},
-                    "search": {"type": "keyword"},
-                    "visualization": {"type": "keyword"}
-                }
-            }
-        }
-        
-        # Kibana 인덱스 삭제 (있다면)
-        requests.delete(f"{ES_URL}/.kibana")
-        
-        # Kibana 인덱스 생성
-        response = requests.put(
-            f"{ES_URL}/.kibana?include_type_name=true",
-            json=kibana_settings
+        # Kibana 인덱스 생성 (이미 있으면 저장된 객체를 지우지 않고 그대로 사용)
+        response = es_client.indices.create(
+            index=".kibana",
+            body=_KIBANA_INDEX_BODY,
+            include_type_name=True,
+            ignore=[400]
         )
-        logger.info(f"Kibana index setup response: {response.text}")
+        logger.info(f"Kibana index setup response: {response}")
         
-        # 2. 기본 템플릿 설정
-        template = {
-            "index_patterns": ["*"],
-            "settings": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0,
-                "index.mapping.total_fields.limit": 2000,
-                "index.mapping.depth.limit": 20,
-                "index.mapping.nested_fields.limit": 50
-            },
-            "mappings": {
-                "dynamic": "true",
-                "properties": {
-                    "projectname": {"type": "keyword"},
-                    "metadata__timestamp": {"type": "date"},
-                    "metadata__updated_on": {"type": "date"},
-                    "grimoire_creation_date": {"type": "date"},
-                    "author_name": {"type": "keyword"},
-                    "author_org_name": {"type": "keyword"},
-                    "author_uuid": {"type": "keyword"},
-                    "title": {"type": "text"},
-                    "repository": {"type": "keyword"}
-                }
-            }
-        }
-        
-        response = requests.put(
-            f"{ES_URL}/_template/grimoirelab_template",
-            json=template
+        # 2. 기본 템플릿 설정 (.kibana가 템플릿 적용 여부와 무관하게 항상 같은 상태로 만들어지도록 순서대로 실행)
+        response = es_client.indices.put_template(
+            name="grimoirelab_template",
+            body=_TEMPLATE_BODY,
+            ignore=[400]
         )
-        logger.info(f"Template setup response: {response.text}")
+        logger.info(f"Template setup response: {response}")
         
         # 3. 기존 인덱스 업데이트
-        indices_response = requests.get(f"{ES_URL}/_cat/indices?format=json")
-        indices = [idx["index"] for idx in indices_response.json()]
+        # cat 포맷터를 거치지 않는 _alias 응답의 키로 열린 인덱스 이름만 가져옴
+        indices = list(es_client.indices.get_alias(expand_wildcards="open"))
         
-        for index in indices:
-            if index.startswith('.'):
-                continue
-            
-            update_mapping = {
-                "dynamic": "true",
-                "properties": {
-                    "projectname": {"type": "keyword"}
-                }
-            }
-            
-            response = requests.put(
-                f"{ES_URL}/{index}/_mapping?include_type_name=true",
-                json={"properties": update_mapping}
+        def put_index_mapping(targets):
+            response = es_client.indices.put_mapping(
+                index=targets,
+                body=_PROJECTNAME_MAPPING_BODY,
+                include_type_name=True,
+                ignore=[400]
             )
-            logger.info(f"Updated mapping for {index}: {response.text}")
+            logger.info(f"Updated mapping for {targets}: {response}")
+        
+        # 같은 매핑을 여러 인덱스에 한 번에 적용 (인덱스 목록을 쉼표로 묶어 동시에 요청)
+        user_indices = [index for index in indices if not index.startswith('.')]
+        batches = [
+            ",".join(user_indices[i:i + _MAPPING_UPDATE_BATCH])
+            for i in range(0, len(user_indices), _MAPPING_UPDATE_BATCH)
+        ]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(_MAPPING_UPDATE_WORKERS, len(batches))) as executor:
+                list(executor.map(put_index_mapping, batches))
+            logger.info(f"Updated projectname mapping for {len(user_indices)} indices")
+        
+        _setup_done = True
         
     except Exception as e:
         logger.error(f"Failed to setup Elasticsearch: {str(e)}")
@@ -108,36 +155,38 @@ def setup_elasticsearch():
 
 def update_git_index_pattern():
     try:
-        # 1. 현재 git 인덱스의 매핑 가져오기
-        mapping = es_client.indices.get_mapping(index="git")
+        # 1. 현재 git 인덱스의 매핑 가져오기 (응답이 큰 요청만 gzip으로 받고, 작은 응답은 압축하지 않음)
+        mapping = es_client.indices.get_mapping(index="git", headers={"accept-encoding": "gzip"})
         
-        # 2. 필드 매핑 생성
-        fields = []
-        
-        # 기존 필드들 추가
-        for field_name, field_props in mapping["git"]["mappings"]["properties"].items():
-            field_type = field_props.get("type", "string")
-            field_obj = {
-                "name": field_name,
-                "type": field_type,
-                "count": 0,
-                "scripted": False,
-                "searchable": True,
-                "aggregatable": True,
-                "readFromDocValues": True
-            }
-            fields.append(field_obj)
-        
-        # pagerank_score 필드 추가
-        fields.append({
-            "name": "pagerank_score",
-            "type": "number",
-            "count": 0,
-            "scripted": False,
-            "searchable": True,
-            "aggregatable": True,
-            "readFromDocValues": True
-        })
+        # 2. 필드 매핑 생성 (매핑이 바뀌지 않았으면 캐시된 필드 목록 재사용)
+        properties = mapping["git"]["mappings"]["properties"]
+        mapping_hash = hashlib.blake2b(
+            orjson.dumps(properties, option=orjson.OPT_SORT_KEYS), digest_size=16
+        ).digest()
+        cached = _index_pattern_fields_cache.get("git")
+        if cached and cached[0] == mapping_hash:
+            fields_json = cached[1]
+        else:
+            # 기존 필드들과 pagerank_score 필드 추가
+            fields = [
+                {"name": field_name, "type": field_props.get("type", "string"), **_INDEX_PATTERN_FIELD_DEFAULTS}
+                for field_name, field_props in properties.items()
+            ]
+            fields.append({"name": "pagerank_score", "type": "number", **_INDEX_PATTERN_FIELD_DEFAULTS})
+            
+            fields_json = orjson.dumps(fields).decode()
+            _index_pattern_fields_cache["git"] = (mapping_hash, fields_json)
+
+        # 저장된 인덱스 패턴의 필드 목록이 같으면 다시 쓰지 않음
+        stored = es_client.get(
+            index=".kibana",
+            id="index-pattern:git",
+            _source_includes=["index-pattern.fields"],
+            ignore=[404]
+        )
+        if stored.get("_source", {}).get("index-pattern", {}).get("fields") == fields_json:
+            logger.info("Git index pattern is up to date, skipping update")
+            return True
 
         # 3. 인덱스 패턴 문서 생성
         index_pattern = {
@@ -145,7 +194,7 @@ def update_git_index_pattern():
             "index-pattern": {
                 "title": "git*",
                 "timeFieldName": "grimoire_creation_date",
-                "fields": json.dumps(fields),
+                "fields": fields_json,
                 "fieldFormatMap": "{}",
                 "sourceFilters": "[]"
             },
@@ -159,8 +208,8 @@ def update_git_index_pattern():
             index=".kibana",
             doc_type="doc",  # Kibana 6.x에서는 doc_type이 필요
             id="index-pattern:git",
-            body=index_pattern,
-            refresh=True
+            body=index_pattern
+            # refresh를 강제하지 않음: Kibana는 다음 주기적 refresh(기본 1초) 이후에 읽어도 충분함
         )
 
         logger.info("Successfully updated git index pattern with pagerank_score field")
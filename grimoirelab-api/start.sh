@@ -7,5 +7,14 @@ if [ -f /root/.ssh/id_rsa ]; then
     ssh-keyscan github.com >> /root/.ssh/known_hosts
 fi
 
-# API 서버 실행
-exec python -m api.app 
\ No newline at end of file
+# API 서버 실행 (FLASK_DEV가 설정되면 Flask 개발 서버 사용)
+if [ -n "$FLASK_DEV" ]; then
+    exec python -m api.app
+fi
+
+# 스케줄러와 작업 상태가 프로세스 메모리에 있으므로 워커는 1개로 두고 스레드로 동시 처리
+exec gunicorn -b 0.0.0.0:9000 \
+    -w "${GUNICORN_WORKERS:-1}" \
+    -k gthread --threads "${GUNICORN_THREADS:-8}" \
+    --timeout 120 \
+    api.app:app 
\ No newline at end of file